@@ -18,35 +18,79 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 import argparse
-from fritzbox import RequestError, ConnectionStatus, Fritzbox
+import asyncio
+from fritzbox import RequestError, ConnectionStatus, Fritzbox, AsyncFritzbox
 
-def main():
-    parser = argparse.ArgumentParser(description='Fritzbox UPnP Control Script')
-    parser.add_argument('--url', type=str, default='http://fritz.box:49000', help='The base URL for the Fritzbox SOAP API')
-    args = parser.parse_args()
+def change_ip(url, use_events):
+    fritzbox = Fritzbox(url)
 
-    fritzbox = Fritzbox(args.url)
+    try:
+        # Get and display the current public IP
+        error_code, public_ip = fritzbox.get_public_ip()
+        if error_code == RequestError.NO_ERROR:
+            print("Current IP is:", public_ip)
+        else:
+            print("Failed to get public IP:", error_code)
 
-    # Get and display the current public IP
-    error_code, public_ip = fritzbox.get_public_ip()
-    if error_code == RequestError.NO_ERROR:
-        print("Current IP is:", public_ip)
-    else:
-        print("Failed to get public IP:", error_code)
+        # Attempt to change the public IP address
+        error_code = fritzbox.change_ip_address_block(use_events=use_events)
+        if error_code == RequestError.NO_ERROR:
+            print("Successfully changed IP address.")
+        else:
+            print("Failed to change IP address:", error_code)
+            return
 
-    # Attempt to change the public IP address
-    error_code = fritzbox.change_ip_address_block()
-    if error_code == RequestError.NO_ERROR:
-        print("Successfully changed IP address.")
-    else:
-        print("Failed to change IP address:", error_code)
-        return
+        # Get and display the new public IP
+        error_code, public_ip = fritzbox.get_public_ip()
+        if error_code == RequestError.NO_ERROR:
+            print("New IP is:", public_ip)
+        else:
+            print("Failed to get new public IP:", error_code)
+    finally:
+        fritzbox.close()
+
+async def change_ip_async(url):
+    # Messages are prefixed with the url to tell the fritzboxes apart
+    async with AsyncFritzbox(url, label=url) as fritzbox:
+        # Get and display the current public IP
+        error_code, public_ip = await fritzbox.get_public_ip()
+        if error_code == RequestError.NO_ERROR:
+            fritzbox.log("Current IP is:", public_ip)
+        else:
+            fritzbox.log("Failed to get public IP:", error_code)
+
+        # Attempt to change the public IP address
+        error_code = await fritzbox.change_ip_address_block()
+        if error_code == RequestError.NO_ERROR:
+            fritzbox.log("Successfully changed IP address.")
+        else:
+            fritzbox.log("Failed to change IP address:", error_code)
+            return
+
+        # Get and display the new public IP
+        error_code, public_ip = await fritzbox.get_public_ip()
+        if error_code == RequestError.NO_ERROR:
+            fritzbox.log("New IP is:", public_ip)
+        else:
+            fritzbox.log("Failed to get new public IP:", error_code)
+
+async def change_ips_async(urls):
+    await asyncio.gather(*(change_ip_async(url) for url in urls))
+
+def main():
+    parser = argparse.ArgumentParser(description='Fritzbox UPnP Control Script')
+    parser.add_argument('--url', type=str, nargs='+', default=['http://fritz.box:49000'], help='The base URL(s) for the Fritzbox SOAP API, several Fritzboxes are processed concurrently (requires aiohttp)')
+    parser.add_argument('--use-events', action='store_true', help='Wait for the status events of the Fritzbox instead of polling (single URL only)')
+    args = parser.parse_args()
 
-    # Get and display the new public IP
-    error_code, public_ip = fritzbox.get_public_ip()
-    if error_code == RequestError.NO_ERROR:
-        print("New IP is:", public_ip)
+    if len(args.url) == 1:
+        change_ip(args.url[0], args.use_events)
+    elif args.use_events:
+        parser.error('--use-events is only supported with a single --url')
     else:
-        print("Failed to get new public IP:", error_code)
+        try:
+            asyncio.run(change_ips_async(args.url))
+        except ImportError as import_err:
+            parser.error(f'several --url values need aiohttp: {import_err}')
 
 main()
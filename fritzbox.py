@@ -18,9 +18,58 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError, TimeoutError as URLLib3TimeoutError
+from urllib3.util.retry import Retry
 from enum import Enum
-from xml.etree import ElementTree as ET
+import asyncio
+import io
+import re
+import socket
+import threading
 import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, urlunsplit
+
+# Prefer the faster lxml parser, fall back to the standard library
+try:
+    from lxml import etree as ET
+    XML_PARSER_OPTIONS = {'resolve_entities': False, 'no_network': True}
+except ImportError:
+    from xml.etree import ElementTree as ET
+    XML_PARSER_OPTIONS = {}
+
+# aiohttp is only needed by AsyncFritzbox
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# The SOAP responses are tiny and carry a single value of interest, so a
+# regex is tried first and the XML parser is only used as a fallback
+IP_REGEX = re.compile(rb'<NewExternalIPAddress>([^<]+)</NewExternalIPAddress>')
+STATUS_REGEX = re.compile(rb'<NewConnectionStatus>([^<]+)</NewConnectionStatus>')
+BYTES_RECEIVED_REGEX = re.compile(rb'<NewTotalBytesReceived>([^<]+)</NewTotalBytesReceived>')
+# Evented state variable in the GENA NOTIFY messages
+EVENT_STATUS_REGEX = re.compile(rb'<ConnectionStatus>([^<]+)</ConnectionStatus>')
+
+# Time in seconds after which a connected status is trusted even if no
+# disconnection was observed after forcing the termination
+RECONNECTION_GRACE_PERIOD = 10
+
+# SOAP envelope without whitespace, already encoded for sending
+SOAP_ENVELOPE = (b'<?xml version="1.0" encoding="utf-8"?>'
+                 b'<s:Envelope s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/" xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">'
+                 b'<s:Body><u:%b xmlns:u="%b"/></s:Body></s:Envelope>')
+
+# (connect, read) timeouts in seconds for each SOAP request
+TIMEOUT = (3.05, 10)
+
+# Duration in seconds requested for GENA event subscriptions
+SUBSCRIPTION_TIMEOUT = 300
+
+# Time in seconds to wait for a status event before polling the status
+EVENT_WAIT_INTERVAL = 5
 
 class ConnectionStatus(Enum):
     """Enum for representing connection statuses."""
@@ -31,6 +80,15 @@ class ConnectionStatus(Enum):
     PENDING_DISCONNECT = 4
     OTHER_CONNECTION_STATUS = 100
 
+# Map of the status strings reported by the Fritzbox
+CONNECTION_STATUS_MAP = {
+    'Connected': ConnectionStatus.CONNECTED,
+    'Connecting': ConnectionStatus.CONNECTING,
+    'Disconnecting': ConnectionStatus.DISCONNECTING,
+    'Disconnected': ConnectionStatus.DISCONNECTED,
+    'PendingDisconnect': ConnectionStatus.PENDING_DISCONNECT
+}
+
 class RequestError(Enum):
     """Enum for representing different request errors."""
     NO_ERROR = 0
@@ -40,8 +98,29 @@ class RequestError(Enum):
     OTHER_ERROR = 100
 
 class SoapUtil:
-    def __init__(self):
-        pass
+    def __init__(self, log=print):
+        # Used for error messages, e.g. Fritzbox.log to prefix them with a label
+        self.log = log
+        # Reuse one session for all SOAP calls to keep the connection alive
+        self.session = requests.Session()
+        # Retry dropped requests and transient server errors, the final
+        # error response is still reported through raise_for_status. UPnP
+        # reports SOAP faults as 500, retrying them would fail the same way.
+        # A single read retry bounds how long one request can take.
+        retries = Retry(total=2, read=1, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                        allowed_methods=frozenset(['POST']), raise_on_status=False)
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries))
+        self.session.headers.update({'Content-Type': 'text/xml; charset=utf-8'})
+        # Session without retries for requests that are not safe to repeat,
+        # e.g. ForceTermination which would end the new WAN session again
+        self.session_no_retry = requests.Session()
+        self.session_no_retry.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=Retry(total=0, raise_on_status=False)))
+        self.session_no_retry.headers.update({'Content-Type': 'text/xml; charset=utf-8'})
+
+    def close(self):
+        """Close the underlying HTTP sessions."""
+        self.session.close()
+        self.session_no_retry.close()
 
     @staticmethod
     def create_soap_request(service_urn, action):
@@ -55,65 +134,417 @@ class SoapUtil:
             tuple: A tuple containing the headers and body for the SOAP request.
         """
         headers = {
-            'SoapAction': f'{service_urn}#{action}',
-            'Content-Type': 'text/xml; charset=utf-8'
+            'SoapAction': f'{service_urn}#{action}'
         }
-        body = f"""<?xml version="1.0" encoding="utf-8"?>
-            <s:Envelope s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/" xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">
-                <s:Body>
-                    <u:{action} xmlns:u=\"{service_urn}\"/>
-                </s:Body>
-            </s:Envelope>"""
+        body = SOAP_ENVELOPE % (action.encode(), service_urn.encode())
         return (headers, body)
 
     @staticmethod
-    def post_soap_request(url, headers, body):
+    def resolve_url(url, log=print):
+        """
+        Resolve the host name of a URL once, to avoid a DNS lookup per request.
+
+        Args:
+            url (str): The URL to resolve.
+            log (callable): Used to report resolution errors.
+
+        Returns:
+            str: The URL with the host name replaced by its IP address, or the
+            unchanged URL if the host name could not be resolved or is an
+            IPv6 address.
+        """
+        parts = urlsplit(url)
+        if parts.hostname is None or ':' in parts.hostname:
+            return url
+        try:
+            ip = socket.gethostbyname(parts.hostname)
+        except (socket.gaierror, UnicodeError) as dns_err:
+            log(f'Could not resolve {parts.hostname}: {dns_err}')
+            return url
+        # Only replace the host, keep any user:password@ and the port
+        userinfo, at, hostport = parts.netloc.rpartition('@')
+        host, colon, port = hostport.partition(':')
+        netloc = f'{userinfo}{at}{ip}{colon}{port}'
+        return urlunsplit(parts._replace(netloc=netloc))
+
+    @staticmethod
+    def find_tag_text(content, tag_regex, tag):
+        """
+        Extract the text of a tag from a SOAP response.
+
+        Args:
+            content (bytes): The SOAP response body.
+            tag_regex (re.Pattern): Precompiled regex capturing the tag text.
+            tag (str): The tag name, used for the XML parser fallback.
+
+        Returns:
+            str: The text of the tag, or None if the tag was not found.
+        """
+        match = tag_regex.search(content)
+        if match is not None:
+            return match.group(1).decode()
+        # Parse incrementally and stop at the first matching tag
+        for event, elem in ET.iterparse(io.BytesIO(content), events=('end',), **XML_PARSER_OPTIONS):
+            if elem.tag == tag or elem.tag.endswith('}' + tag):
+                return elem.text
+            elem.clear()
+        return None
+
+    @staticmethod
+    def get_local_ip(url):
+        """
+        Get the local IP address used to reach the host of a URL.
+
+        Args:
+            url (str): The URL of the remote host.
+
+        Returns:
+            str: The local IP address, or None if it could not be determined.
+        """
+        parts = urlsplit(url)
+        if parts.hostname is None:
+            return None
+        try:
+            # Connecting a UDP socket sends nothing, it only selects the route
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.connect((parts.hostname, parts.port or 80))
+                return sock.getsockname()[0]
+        except (OSError, UnicodeError):
+            return None
+
+    @staticmethod
+    def is_retried_timeout(conn_err):
+        """
+        Check whether a connection error is a timeout that exhausted the retries.
+
+        Once the retries are exhausted, urllib3 raises MaxRetryError and requests
+        reports it as ConnectionError, even if every attempt timed out.
+
+        Args:
+            conn_err (requests.exceptions.ConnectionError): The raised error.
+
+        Returns:
+            bool: True if the retries ended with a timeout.
+        """
+        max_retry_err = conn_err.args[0] if conn_err.args else None
+        if not isinstance(max_retry_err, MaxRetryError):
+            return False
+        # NewConnectionError derives from ConnectTimeoutError but is a refused connection
+        reason = max_retry_err.reason
+        return isinstance(reason, URLLib3TimeoutError) and not isinstance(reason, NewConnectionError)
+
+    def send_request(self, method, url, headers, body = None, retry = True):
+        """
+        Send an HTTP request to the Fritzbox and handle request errors.
+
+        Args:
+            method (str): The HTTP method, e.g. POST or SUBSCRIBE.
+            url (str): The URL of the service.
+            headers (dict): The request headers.
+            body (bytes): The request body, if any.
+            retry (bool): Whether the request may be retried on transient failures.
+
+        Returns:
+            tuple: A tuple containing the request error code and the response (None on error).
+        """
         error_code = RequestError.NO_ERROR
+        response = None
+        session = self.session if retry else self.session_no_retry
         try:
-            response = requests.post(url, headers = headers, data = body)
-            response.raise_for_status()
+            # The body is read in full, the values are extracted from it by regex.
+            # Closing the response hands the connection back to the pool.
+            with session.request(method, url, headers = headers, data = body, timeout = TIMEOUT) as received:
+                received.raise_for_status()
+                response = received
         except requests.exceptions.HTTPError as http_err:
-            print(f'HTTP error occurred: {http_err}')
+            self.log(f'HTTP error occurred: {http_err}')
             error_code = RequestError.HTTP_ERROR
-        except requests.exceptions.ConnectionError as conn_err:
-            print(f'Connection error occurred: {conn_err}')
-            error_code = RequestError.CONNECTION_ERROR
+        # Checked before ConnectionError since ConnectTimeout derives from both
         except requests.exceptions.Timeout as timeout_err:
-            print(f'Timeout error occurred: {timeout_err}')
+            self.log(f'Timeout error occurred: {timeout_err}')
             error_code = RequestError.TIMEOUT_ERROR
+        except requests.exceptions.ConnectionError as conn_err:
+            if self.is_retried_timeout(conn_err):
+                self.log(f'Timeout error occurred: {conn_err}')
+                error_code = RequestError.TIMEOUT_ERROR
+            else:
+                self.log(f'Connection error occurred: {conn_err}')
+                error_code = RequestError.CONNECTION_ERROR
         except requests.exceptions.RequestException as req_err:
-            print(f'Request exception occurred: {req_err}')
+            self.log(f'Request exception occurred: {req_err}')
             error_code = RequestError.OTHER_ERROR
 
         return (error_code, response)
 
+    def post_soap_request(self, url, headers, body, retry = True):
+        """
+        Post a SOAP request and handle request errors.
+
+        Args:
+            url (str): The control URL of the service.
+            headers (dict): The SOAP request headers.
+            body (bytes): The SOAP request body.
+            retry (bool): Whether the request may be retried on transient failures.
+
+        Returns:
+            tuple: A tuple containing the request error code and the response body (None on error).
+        """
+        error_code, response = self.send_request('POST', url, headers, body, retry)
+        content = response.content if response is not None else None
+        return (error_code, content)
+
 class WANIPConnection:
     def __init__(self):
         self.service_urn = 'urn:schemas-upnp-org:service:WANIPConnection:1'
         self.control_url = '/igdupnp/control/WANIPConn1'
+        self.event_sub_url = '/igdupnp/control/WANIPConn1'
         self.action_GetExternalIPAddress = 'GetExternalIPAddress'
         self.action_ForceTermination = 'ForceTermination'
         self.action_GetStatusInfo = 'GetStatusInfo'
+        # The requests never change, build them once
+        self.req_get_ip = SoapUtil.create_soap_request(self.service_urn, self.action_GetExternalIPAddress)
+        self.req_force_term = SoapUtil.create_soap_request(self.service_urn, self.action_ForceTermination)
+        self.req_status = SoapUtil.create_soap_request(self.service_urn, self.action_GetStatusInfo)
 
 class WANCommonInterfaceConfig:
     def __init__(self):
         self.service_urn = 'urn:schemas-upnp-org:service:WANCommonInterfaceConfig:1'
         self.control_url = '/igdupnp/control/WANCommonIFC1'
         self.action_GetTotalBytesReceived = 'GetTotalBytesReceived'
+        self.req_total_bytes_received = SoapUtil.create_soap_request(self.service_urn, self.action_GetTotalBytesReceived)
 
-class Fritzbox:
-    """Class for interacting with the Fritzbox router via UPnP."""
-    def __init__(self, soap_url):
+class StatusEventListener:
+    """Minimal HTTP server receiving the connection status events of the Fritzbox."""
+    def __init__(self, local_ip):
         """
-        Initialize Fritzbox with the provided SOAP URL.
+        Start listening for GENA NOTIFY messages on an ephemeral port.
+
+        Args:
+            local_ip (str): The local IP address the Fritzbox can reach.
+        """
+        self.disconnected = threading.Event()
+        self.reconnected = threading.Event()
+        # Subscription ID, set once the subscription succeeded
+        self.sid = None
+        listener = self
+
+        class NotifyHandler(BaseHTTPRequestHandler):
+            def do_NOTIFY(self):
+                if not listener.accepts(self.headers):
+                    self.send_error(412)
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    self.send_error(400)
+                    return
+                listener.handle_event(self.rfile.read(length))
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer((local_ip, 0), NotifyHandler)
+        self.callback_url = f'http://{local_ip}:{self.server.server_port}/'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def accepts(self, headers):
+        """
+        Check that a NOTIFY message is a property change of our subscription.
+
+        Args:
+            headers (email.message.Message): The headers of the NOTIFY message.
+
+        Returns:
+            bool: True if the message shall be handled.
+        """
+        # Any host on the LAN can send a NOTIFY, only trust our own subscription.
+        # The initial event may arrive before the SID is known, it only reports
+        # the current status and is ignored anyway.
+        return self.sid is not None and headers.get('SID') == self.sid and \
+            headers.get('NT') == 'upnp:event' and headers.get('NTS') == 'upnp:propchange'
+
+    def handle_event(self, content):
+        """
+        Track the connection status reported by a NOTIFY message.
+
+        Args:
+            content (bytes): The body of the NOTIFY message.
+        """
+        try:
+            connection_status_text = SoapUtil.find_tag_text(content, EVENT_STATUS_REGEX, 'ConnectionStatus')
+        except ET.ParseError:
+            return
+        if connection_status_text is None:
+            return
+        # The first event reports the current status, which is still connected,
+        # so a connected status only counts once the disconnection was seen
+        if Fritzbox.decode_connection_status(connection_status_text) != ConnectionStatus.CONNECTED:
+            self.disconnected.set()
+        elif self.disconnected.is_set():
+            self.reconnected.set()
+
+    def close(self):
+        """Stop the server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+class ReconnectionWaiter:
+    """Tracks the connection status while waiting for the Fritzbox to reconnect."""
+    def __init__(self, timeout):
+        """
+        Start waiting for the reconnection.
+
+        Args:
+            timeout (float): Maximum time in seconds to wait for the reconnection.
+        """
+        self.start = time.monotonic()
+        self.deadline = self.start + timeout
+        self.disconnected = False
+        self.delay = 0.5
+
+    def is_reconnected(self, connection_status):
+        """
+        Check whether a polled connection status ends the wait.
+
+        Args:
+            connection_status (ConnectionStatus): The polled connection status.
+
+        Returns:
+            bool: True if the Fritzbox reconnected.
+        """
+        if connection_status != ConnectionStatus.CONNECTED:
+            self.disconnected = True
+            return False
+        # A connected status only counts once the disconnection was seen,
+        # or after the grace period the fritzbox needs to process the request
+        return self.disconnected or time.monotonic() - self.start >= RECONNECTION_GRACE_PERIOD
+
+    def timed_out(self):
+        """Check whether the deadline passed."""
+        return time.monotonic() >= self.deadline
+
+    def next_delay(self):
+        """Get the time in seconds until the next poll, backing off exponentially."""
+        delay = self.delay
+        self.delay = min(self.delay * 1.5, 2.0)
+        return delay
+
+    def grace_period_wait_time(self):
+        """Get the time in seconds to wait for the disconnection event, within the deadline."""
+        return min(RECONNECTION_GRACE_PERIOD, max(self.deadline - time.monotonic(), 0))
+
+    def event_wait_time(self):
+        """Get the time in seconds to wait for a status event before polling."""
+        return min(EVENT_WAIT_INTERVAL, max(self.deadline - time.monotonic(), 0))
+
+class FritzboxBase:
+    """Common part of Fritzbox and AsyncFritzbox, independent of the HTTP client."""
+    def __init__(self, soap_url, label=None):
+        """
+        Initialize the Fritzbox with the provided SOAP URL.
 
         Args:
             soap_url (str): The base URL for the Fritzbox SOAP API.
+            label (str): Optional prefix for the printed messages, e.g. to tell
+                several Fritzboxes apart.
         """
-        self.soap_util = SoapUtil()
         self.soap_url = soap_url
+        self.label = label
+        self.resolved_soap_url = self.resolve_soap_url(soap_url)
         self.WANIPConnection = WANIPConnection()
         self.WANCommonInterfaceConfig = WANCommonInterfaceConfig()
+        self.WANIPConnection_url = self.resolved_soap_url + self.WANIPConnection.control_url
+        self.WANIPConnection_event_url = self.resolved_soap_url + self.WANIPConnection.event_sub_url
+        self.WANCommonInterfaceConfig_url = self.resolved_soap_url + self.WANCommonInterfaceConfig.control_url
+
+    def resolve_soap_url(self, soap_url):
+        """
+        Get the base URL used for the requests, the SOAP URL as is by default.
+
+        Args:
+            soap_url (str): The base URL for the Fritzbox SOAP API.
+
+        Returns:
+            str: The base URL used for the requests.
+        """
+        return soap_url
+
+    def log(self, *args):
+        """Print a message, prefixed with the label if any."""
+        if self.label is not None:
+            print(f'[{self.label}]', *args)
+        else:
+            print(*args)
+
+    @staticmethod
+    def decode_connection_status(connection_status_text):
+        """
+        Decode the connection status reported by the Fritzbox.
+
+        Args:
+            connection_status_text (str): The text of the NewConnectionStatus tag.
+
+        Returns:
+            ConnectionStatus: The decoded connection status.
+        """
+        return CONNECTION_STATUS_MAP.get(connection_status_text, ConnectionStatus.OTHER_CONNECTION_STATUS)
+
+    def parse_public_ip(self, content):
+        """Extract the public IP address from a GetExternalIPAddress response."""
+        public_ip = SoapUtil.find_tag_text(content, IP_REGEX, 'NewExternalIPAddress')
+        if public_ip is None:
+            self.log("External IP Address not found in response.")
+        return public_ip
+
+    def parse_connection_status(self, content):
+        """Extract the connection status from a GetStatusInfo response."""
+        connection_status_text = SoapUtil.find_tag_text(content, STATUS_REGEX, 'NewConnectionStatus')
+        if connection_status_text is None:
+            return None
+        return self.decode_connection_status(connection_status_text)
+
+    def parse_total_bytes_received(self, content):
+        """Extract the received byte count from a GetTotalBytesReceived response."""
+        byte_received = SoapUtil.find_tag_text(content, BYTES_RECEIVED_REGEX, 'NewTotalBytesReceived')
+        if byte_received is None:
+            self.log("TotalBytesReceived not found in response.")
+        return byte_received
+
+class Fritzbox(FritzboxBase):
+    """Class for interacting with the Fritzbox router via UPnP."""
+    def __init__(self, soap_url, label=None):
+        """
+        Initialize Fritzbox with the provided SOAP URL.
+
+        Args:
+            soap_url (str): The base URL for the Fritzbox SOAP API.
+            label (str): Optional prefix for the printed messages.
+        """
+        super().__init__(soap_url, label)
+        self.soap_util = SoapUtil(self.log)
+
+    def resolve_soap_url(self, soap_url):
+        """
+        Pin the address of the fritzbox, e.g. fritz.box, for all requests.
+
+        Args:
+            soap_url (str): The base URL for the Fritzbox SOAP API.
+
+        Returns:
+            str: The base URL with the host name replaced by its IP address.
+        """
+        return SoapUtil.resolve_url(soap_url, self.log)
+
+    def close(self):
+        """
+        Close the connection to the Fritzbox.
+        """
+        self.soap_util.close()
 
     def get_public_ip(self):
         """
@@ -124,16 +555,10 @@ class Fritzbox:
         """
         public_ip = None
         error_code = RequestError.NO_ERROR
-        headers, body = self.soap_util.create_soap_request(self.WANIPConnection.service_urn, self.WANIPConnection.action_GetExternalIPAddress)
-        error_code, response = self.soap_util.post_soap_request(self.soap_url + self.WANIPConnection.control_url, headers, body)
+        headers, body = self.WANIPConnection.req_get_ip
+        error_code, content = self.soap_util.post_soap_request(self.WANIPConnection_url, headers, body)
         if error_code == RequestError.NO_ERROR:
-            root = ET.fromstring(response.content)
-            # Find the tag containing the ExternalIPAddress
-            ip_tag = root.find('.//NewExternalIPAddress')
-            if ip_tag is not None:
-                public_ip = ip_tag.text
-            else:
-                print("External IP Address not found in response.")
+            public_ip = self.parse_public_ip(content)
         return (error_code, public_ip)
 
     def get_connection_status(self):
@@ -145,25 +570,10 @@ class Fritzbox:
         """
         connection_status = None
         error_code = RequestError.NO_ERROR
-        headers, body = self.soap_util.create_soap_request(self.WANIPConnection.service_urn, self.WANIPConnection.action_GetStatusInfo)
-        error_code, response = self.soap_util.post_soap_request(self.soap_url + self.WANIPConnection.control_url, headers, body)
+        headers, body = self.WANIPConnection.req_status
+        error_code, content = self.soap_util.post_soap_request(self.WANIPConnection_url, headers, body)
         if error_code == RequestError.NO_ERROR:
-            root = ET.fromstring(response.content)
-            # Find the tag containing the ExternalIPAddress
-            connection_status_tag = root.find('.//NewConnectionStatus')
-            if connection_status_tag is not None:
-                if connection_status_tag.text == 'Connected':
-                    connection_status = ConnectionStatus.CONNECTED
-                elif connection_status_tag.text == 'Connecting':
-                    connection_status = ConnectionStatus.CONNECTING
-                elif connection_status_tag.text == 'Disconnecting':
-                    connection_status = ConnectionStatus.DISCONNECTING
-                elif connection_status_tag.text == 'Disconnected':
-                    connection_status = ConnectionStatus.DISCONNECTED
-                elif connection_status_tag.text == 'PendingDisconnect':
-                    connection_status = ConnectionStatus.PENDING_DISCONNECT
-                else:
-                    connection_status = ConnectionStatus.OTHER_CONNECTION_STATUS
+            connection_status = self.parse_connection_status(content)
         return (error_code, connection_status)
 
 
@@ -175,46 +585,297 @@ class Fritzbox:
             RequestError: The request error code indicating the success or failure of the operation.
         """
         error_code = RequestError.NO_ERROR
-        headers, body = self.soap_util.create_soap_request(self.WANIPConnection.service_urn, self.WANIPConnection.action_ForceTermination)
-        error_code, response = self.soap_util.post_soap_request(self.soap_url + self.WANIPConnection.control_url, headers, body)
+        headers, body = self.WANIPConnection.req_force_term
+        # Never retried, a repeated ForceTermination ends the new connection
+        error_code, content = self.soap_util.post_soap_request(self.WANIPConnection_url, headers, body, retry = False)
+        return error_code
+
+    def subscribe_status(self, callback_url):
+        """
+        Subscribe to the connection status events of the Fritzbox (UPnP GENA).
+
+        Args:
+            callback_url (str): The URL the Fritzbox shall send the NOTIFY messages to.
+
+        Returns:
+            tuple: A tuple containing the request error code and the subscription ID.
+        """
+        sid = None
+        headers = {
+            'NT': 'upnp:event',
+            'CALLBACK': f'<{callback_url}>',
+            'TIMEOUT': f'Second-{SUBSCRIPTION_TIMEOUT}'
+        }
+        error_code, response = self.soap_util.send_request('SUBSCRIBE', self.WANIPConnection_event_url, headers)
+        if error_code == RequestError.NO_ERROR:
+            sid = response.headers.get('SID')
+            if sid is None:
+                self.log("SID not found in subscription response.")
+                error_code = RequestError.OTHER_ERROR
+        return (error_code, sid)
+
+    def unsubscribe_status(self, sid):
+        """
+        Cancel a subscription to the connection status events.
+
+        Args:
+            sid (str): The subscription ID returned by subscribe_status.
+
+        Returns:
+            RequestError: The request error code indicating the success or failure of the operation.
+        """
+        error_code, response = self.soap_util.send_request('UNSUBSCRIBE', self.WANIPConnection_event_url, {'SID': sid})
         return error_code
 
-    def change_ip_address_block(self):
+    def start_status_events(self):
+        """
+        Start a listener and subscribe it to the connection status events.
+
+        Returns:
+            tuple: A tuple containing the listener and the subscription ID, both None on failure.
+        """
+        local_ip = self.soap_util.get_local_ip(self.resolved_soap_url)
+        if local_ip is None:
+            return (None, None)
+        try:
+            listener = StatusEventListener(local_ip)
+        except OSError as os_err:
+            self.log(f'Could not start status event listener: {os_err}')
+            return (None, None)
+        error_code, sid = self.subscribe_status(listener.callback_url)
+        if error_code != RequestError.NO_ERROR:
+            listener.close()
+            return (None, None)
+        listener.sid = sid
+        return (listener, sid)
+
+    def change_ip_address_block(self, timeout=60, use_events=False):
         """
         Change the public IP address and wait for reconnection.
 
+        Args:
+            timeout (float): Maximum time in seconds to wait for the reconnection.
+            use_events (bool): Wait for the status events of the Fritzbox instead of
+                polling, polling is still used if the subscription fails.
+
+        Returns:
+            RequestError: The request error code indicating the success or failure of the operation.
+        """
+        listener, sid = (None, None)
+        if use_events:
+            listener, sid = self.start_status_events()
+        try:
+            return self.wait_for_reconnection(timeout, listener)
+        finally:
+            if listener is not None:
+                self.unsubscribe_status(sid)
+                listener.close()
+
+    def wait_for_reconnection(self, timeout, listener):
+        """
+        Force a termination and wait for the Fritzbox to reconnect.
+
+        Args:
+            timeout (float): Maximum time in seconds to wait for the reconnection.
+            listener (StatusEventListener): Subscribed event listener, or None to poll.
+
         Returns:
             RequestError: The request error code indicating the success or failure of the operation.
         """
         error_code = RequestError.NO_ERROR
         error_code = self.change_ip_address()
         if error_code == RequestError.NO_ERROR:
-            # Wait for 10 seconds to let the fritzbox process the request
-            for i in range(5):
-                print('Reconnection pending...')
-                time.sleep(2)
+            waiter = ReconnectionWaiter(timeout)
+            if listener is not None:
+                self.log('Reconnection pending...')
+                waiter.disconnected = listener.disconnected.wait(waiter.grace_period_wait_time())
+                if not waiter.disconnected:
+                    self.log('No disconnection event received, polling the connection status.')
+                    listener = None
             while True:
+                # Wait for the reconnection event in bounded slices and poll in
+                # between, so that a lost event does not stall until the deadline
+                if listener is not None and listener.reconnected.wait(waiter.event_wait_time()):
+                    break
                 error_code, connection_status = self.get_connection_status()
                 if error_code != RequestError.NO_ERROR:
                     break
-                if connection_status == ConnectionStatus.CONNECTED:
+                if waiter.is_reconnected(connection_status):
                     break
-                print('Reconnection pending...')
-                print(connection_status)
-                time.sleep(2)
+                if waiter.timed_out():
+                    self.log('Reconnection timed out.')
+                    error_code = RequestError.TIMEOUT_ERROR
+                    break
+                self.log('Reconnection pending...')
+                self.log(connection_status)
+                if listener is None:
+                    time.sleep(waiter.next_delay())
         return error_code
 
     def get_total_bytes_received(self):
         byte_received = None
         error_code = RequestError.NO_ERROR
-        headers, body = self.soap_util.create_soap_request(self.WANCommonInterfaceConfig.service_urn, self.WANCommonInterfaceConfig.action_GetTotalBytesReceived)
-        error_code, response = self.soap_util.post_soap_request(self.soap_url + self.WANCommonInterfaceConfig.control_url, headers, body)
+        headers, body = self.WANCommonInterfaceConfig.req_total_bytes_received
+        error_code, content = self.soap_util.post_soap_request(self.WANCommonInterfaceConfig_url, headers, body)
         if error_code == RequestError.NO_ERROR:
-            root = ET.fromstring(response.content)
-            # Find the tag containing the ExternalIPAddress
-            byte_received_tag = root.find('.//NewTotalBytesReceived')
-            if byte_received_tag is not None:
-                byte_received = byte_received_tag.text
-            else:
-                print("TotalBytesReceived not found in response.")
+            byte_received = self.parse_total_bytes_received(content)
+        return (error_code, byte_received)
+
+class AsyncSoapUtil:
+    def __init__(self, log=print):
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for AsyncFritzbox')
+        # Used for error messages, e.g. AsyncFritzbox.log to prefix them with a label
+        self.log = log
+        # Keep-alive connections, no limit on concurrent connections and
+        # DNS results cached for the lifetime of the session
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, force_close=False, ttl_dns_cache=None),
+            timeout=aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1]),
+            headers={'Content-Type': 'text/xml; charset=utf-8'})
+
+    async def close(self):
+        """Close the underlying HTTP session."""
+        await self.session.close()
+
+    async def post_soap_request(self, url, headers, body):
+        """
+        Post a SOAP request and handle request errors.
+
+        Args:
+            url (str): The control URL of the service.
+            headers (dict): The SOAP request headers.
+            body (bytes): The SOAP request body.
+
+        Returns:
+            tuple: A tuple containing the request error code and the response body (None on error).
+        """
+        error_code = RequestError.NO_ERROR
+        content = None
+        try:
+            async with self.session.post(url, headers = headers, data = body) as response:
+                response.raise_for_status()
+                content = await response.read()
+        except aiohttp.ClientResponseError as http_err:
+            self.log(f'HTTP error occurred: {http_err}')
+            error_code = RequestError.HTTP_ERROR
+        # Checked before ClientConnectionError since ServerTimeoutError derives from both
+        except asyncio.TimeoutError as timeout_err:
+            self.log(f'Timeout error occurred: {timeout_err}')
+            error_code = RequestError.TIMEOUT_ERROR
+        except aiohttp.ClientConnectionError as conn_err:
+            self.log(f'Connection error occurred: {conn_err}')
+            error_code = RequestError.CONNECTION_ERROR
+        except aiohttp.ClientError as req_err:
+            self.log(f'Request exception occurred: {req_err}')
+            error_code = RequestError.OTHER_ERROR
+
+        return (error_code, content)
+
+class AsyncFritzbox(FritzboxBase):
+    """
+    Asynchronous variant of Fritzbox, based on aiohttp.
+
+    Allows driving several Fritzbox routers concurrently, e.g. with asyncio.gather.
+    Must be created from within a running event loop. Status events are not
+    supported, the reconnection is always polled.
+    """
+    def __init__(self, soap_url, label=None):
+        """
+        Initialize AsyncFritzbox with the provided SOAP URL.
+
+        Args:
+            soap_url (str): The base URL for the Fritzbox SOAP API.
+            label (str): Optional prefix for the printed messages.
+        """
+        # The host name is not pinned, a blocking lookup would stall the other
+        # Fritzboxes of the event loop. The aiohttp connector caches DNS instead.
+        super().__init__(soap_url, label)
+        self.soap_util = AsyncSoapUtil(self.log)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the connection to the Fritzbox.
+        """
+        await self.soap_util.close()
+
+    async def get_public_ip(self):
+        """
+        Get the public IP address of the Fritzbox.
+
+        Returns:
+            tuple: A tuple containing the request error code and the public IP address.
+        """
+        public_ip = None
+        headers, body = self.WANIPConnection.req_get_ip
+        error_code, content = await self.soap_util.post_soap_request(self.WANIPConnection_url, headers, body)
+        if error_code == RequestError.NO_ERROR:
+            public_ip = self.parse_public_ip(content)
+        return (error_code, public_ip)
+
+    async def get_connection_status(self):
+        """
+        Get the connection status of the Fritzbox.
+
+        Returns:
+            tuple: A tuple containing the request error code and the connection status.
+        """
+        connection_status = None
+        headers, body = self.WANIPConnection.req_status
+        error_code, content = await self.soap_util.post_soap_request(self.WANIPConnection_url, headers, body)
+        if error_code == RequestError.NO_ERROR:
+            connection_status = self.parse_connection_status(content)
+        return (error_code, connection_status)
+
+    async def change_ip_address(self):
+        """
+        Change the public IP address by forcing a termination.
+
+        Returns:
+            RequestError: The request error code indicating the success or failure of the operation.
+        """
+        headers, body = self.WANIPConnection.req_force_term
+        error_code, content = await self.soap_util.post_soap_request(self.WANIPConnection_url, headers, body)
+        return error_code
+
+    async def change_ip_address_block(self, timeout=60):
+        """
+        Change the public IP address and wait for reconnection.
+
+        Args:
+            timeout (float): Maximum time in seconds to wait for the reconnection.
+
+        Returns:
+            RequestError: The request error code indicating the success or failure of the operation.
+        """
+        error_code = await self.change_ip_address()
+        if error_code == RequestError.NO_ERROR:
+            waiter = ReconnectionWaiter(timeout)
+            while True:
+                error_code, connection_status = await self.get_connection_status()
+                if error_code != RequestError.NO_ERROR:
+                    break
+                if waiter.is_reconnected(connection_status):
+                    break
+                if waiter.timed_out():
+                    self.log('Reconnection timed out.')
+                    error_code = RequestError.TIMEOUT_ERROR
+                    break
+                self.log('Reconnection pending...')
+                self.log(connection_status)
+                await asyncio.sleep(waiter.next_delay())
+        return error_code
+
+    async def get_total_bytes_received(self):
+        byte_received = None
+        headers, body = self.WANCommonInterfaceConfig.req_total_bytes_received
+        error_code, content = await self.soap_util.post_soap_request(self.WANCommonInterfaceConfig_url, headers, body)
+        if error_code == RequestError.NO_ERROR:
+            byte_received = self.parse_total_bytes_received(content)
         return (error_code, byte_received)